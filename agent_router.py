@@ -1,19 +1,290 @@
-from openai import OpenAI
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from functools import wraps
 
+import numpy as np
+from qdrant_client.http.models import PointStruct
+
+from clients import openai_client
 from models import RouteClassification
 from models import AgentType, ExtractedParams
+from supports import embedding_model, ensure_collection, normalize_prompt, qdrant_client, query_embedding, text_embeddings_batch
 
 from dotenv import load_dotenv
 load_dotenv()
 
+ROUTER_CACHE_COLLECTION = "router_cache"
+ROUTER_CACHE_SIZE = 1024
+SEMANTIC_CACHE_THRESHOLD = 0.95
+CACHE_MIN_CONFIDENCE = 0.7  # Fallback and low-confidence routes are never reused
+
+CENTROID_CACHE_PATH = os.path.join(".cache", "router_centroids.json")
+LOCAL_ROUTING_MARGIN = 0.15  # Minimum similarity gap between the best and runner-up agent
+
+# Representative prompts used to build one embedding centroid per agent type
+ROUTING_EXAMPLES = {
+    AgentType.DEVELOPER_ASSISTANT: [
+        "analyze logs in project/logs",
+        "analyze code in project/src directory",
+        "check for bugs in index.js",
+        "review code quality in main.py",
+        "find errors in error.log file",
+        "check performance issues in logs",
+        "analyze and fix bugs in project",
+        "suggest fixes for log errors",
+        "debug this stack trace from the server",
+    ],
+    AgentType.CUSTOMER_ASSISTANT: [
+        "check status of order 12345",
+        "check my order status for order #12345",
+        "I need a refund for my purchase",
+        "what is your refund policy?",
+        "help me with my account issues",
+        "track my recent purchases",
+        "cancel my subscription",
+        "I was charged twice on my bill",
+    ],
+    AgentType.GENERAL_ASSISTANT: [
+        "what are the best practices for API design?",
+        "how can I improve my code quality?",
+        "explain the difference between async and sync",
+        "what is dependency injection?",
+        "hello, what can you do?",
+        "recommend resources to learn Kubernetes",
+    ],
+}
+
+ORDER_ID_PATTERN = re.compile(r'\border\s*#?\s*(\d+)', re.IGNORECASE)
+FILE_PATH_PATTERN = re.compile(r'[\w./-]+\.(?:py|js|log|md)\b')
+# Only a path introduced by a preposition counts, so "async/await" or "TCP/IP" is not a directory
+DIRECTORY_PATTERN = re.compile(r'\b(?:in|at|inside)\s+([\w./-]+/[\w./-]+)', re.IGNORECASE)
+# A customer keyword alone ("in order to", "cancel a rebase") is too weak to route on; only
+# possessive phrases about the user's own orders/billing count as a customer signal
+CUSTOMER_PHRASE_PATTERN = re.compile(
+    r'\b(?:my|our)\s+(?:recent\s+)?(?:orders?|refunds?|subscriptions?|bill(?:ing)?|purchases?)\b',
+    re.IGNORECASE
+)
+DEVELOPER_KEYWORD_PATTERN = re.compile(r'\b(?:analy[sz]e|bugs?|logs?|errors?|code|debug|fix)\b', re.IGNORECASE)
+
+def extract_params_locally(prompt: str) -> ExtractedParams:
+    """Extract directory, file path and order ID with regular expressions"""
+    order_match = ORDER_ID_PATTERN.search(prompt)
+    file_match = FILE_PATH_PATTERN.search(prompt)
+    # Don't report the directory part of a file path as a separate directory
+    remaining = prompt[:file_match.start()] + " " + prompt[file_match.end():] if file_match else prompt
+    directory_match = DIRECTORY_PATTERN.search(remaining)
+
+    return ExtractedParams(
+        directory=directory_match.group(1).rstrip("./") if directory_match else None,
+        file_path=file_match.group(0) if file_match else None,
+        order_id=order_match.group(1) if order_match else None
+    )
+
+def classify_by_keywords(prompt: str) -> RouteClassification:
+    """Route unambiguous prompts from regex signals alone; returns None when the LLM should decide"""
+    params = extract_params_locally(prompt)
+    is_customer = bool(params.order_id or CUSTOMER_PHRASE_PATTERN.search(prompt))
+    is_developer = bool((params.directory or params.file_path) and DEVELOPER_KEYWORD_PATTERN.search(prompt))
+
+    if is_customer == is_developer:
+        return None  # No signal, or signals for both agents
+
+    if is_customer:
+        agent_type = AgentType.CUSTOMER_ASSISTANT
+        reasoning = "Order ID or customer support phrase found in request"
+    else:
+        agent_type = AgentType.DEVELOPER_ASSISTANT
+        reasoning = "Developer keyword and file or directory path found in request"
+
+    return RouteClassification(
+        agent_type=agent_type,
+        confidence=0.9,
+        reasoning=reasoning,
+        extracted_params=params
+    )
+
+def cached_classification(classify):
+    """Serve repeated prompts from an exact-match cache and rephrased ones from a semantic cache"""
+
+    @wraps(classify)
+    def wrapper(self, user_prompt: str, query_vector: list = None) -> RouteClassification:
+        key = hashlib.sha256(normalize_prompt(user_prompt).encode("utf-8")).hexdigest()
+
+        # Tier 1: exact match on the normalized prompt
+        with self._exact_cache_lock:
+            cached = self._exact_cache.get(key)
+            if cached is not None:
+                self._exact_cache.move_to_end(key)
+        if cached is not None:
+            return RouteClassification.model_validate_json(cached)
+
+        # Tier 2: semantic match against previously routed prompts
+        try:
+            if query_vector is None:
+                query_vector = query_embedding(user_prompt)
+            hits = qdrant_client.query_points(
+                collection_name=ROUTER_CACHE_COLLECTION,
+                query=query_vector,
+                limit=1,
+                score_threshold=SEMANTIC_CACHE_THRESHOLD,
+                with_payload=True
+            ).points
+            if hits:
+                cached = hits[0].payload["classification"]
+                self._remember(key, cached)
+                return RouteClassification.model_validate_json(cached)
+        except Exception:
+            pass  # Cache is best-effort; fall through to the LLM
+
+        # Tier 3: ask the LLM and populate both caches
+        classification = classify(self, user_prompt, query_vector=query_vector)
+        if classification.confidence < CACHE_MIN_CONFIDENCE:
+            return classification
+
+        serialized = classification.model_dump_json()
+        self._remember(key, serialized)
+
+        # Extracted params (paths, order IDs) are prompt-specific, so only
+        # parameter-free routes are shared with semantically similar prompts
+        params = classification.extracted_params
+        if query_vector is not None and not (params and params.model_dump(exclude_none=True)):
+            try:
+                self._ensure_cache_collection(len(query_vector))
+                qdrant_client.upsert(
+                    collection_name=ROUTER_CACHE_COLLECTION,
+                    points=[PointStruct(
+                        id=str(uuid.UUID(key[:32])),
+                        vector=query_vector,
+                        payload={"prompt": normalize_prompt(user_prompt), "classification": serialized}
+                    )]
+                )
+            except Exception:
+                pass
+
+        return classification
+
+    return wrapper
+
 class AgentRouter:
     """Routes user queries to appropriate specialized agents using OpenAI structured outputs"""
     
     def __init__(self):
-        self.client = OpenAI()
-        self.model = "gpt-4o"
+        self.client = openai_client
+        self.model = "gpt-4o-mini"
+        # Shared by every session and mutated from asyncio.to_thread workers
+        self._exact_cache = OrderedDict()
+        self._exact_cache_lock = threading.Lock()
+        self._cache_collection_ready = False
+        self._centroids = None
+
+    def _remember(self, key: str, serialized: str):
+        """Store a serialized classification in the bounded exact-match cache"""
+        with self._exact_cache_lock:
+            self._exact_cache[key] = serialized
+            self._exact_cache.move_to_end(key)
+            if len(self._exact_cache) > ROUTER_CACHE_SIZE:
+                self._exact_cache.popitem(last=False)
+
+    def _ensure_cache_collection(self, vector_size: int):
+        if self._cache_collection_ready:
+            return
+        ensure_collection(ROUTER_CACHE_COLLECTION, vector_size)
+        self._cache_collection_ready = True
+
+    def _load_centroids(self):
+        """Embed the routing examples once and keep one normalized centroid per agent type on disk"""
+        if self._centroids is not None:
+            return self._centroids
+
+        agent_types = list(ROUTING_EXAMPLES)
+        examples = [prompt for agent_type in agent_types for prompt in ROUTING_EXAMPLES[agent_type]]
+        cache_key = hashlib.sha256(json.dumps([embedding_model, examples]).encode("utf-8")).hexdigest()
+
+        centroids = None
+        try:
+            with open(CENTROID_CACHE_PATH, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("key") == cache_key:
+                centroids = np.array([cached["centroids"][agent_type.value] for agent_type in agent_types])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            pass  # Missing or corrupt cache file: treat as a miss and regenerate it below
+
+        if centroids is None:
+            vectors = np.array(text_embeddings_batch([normalize_prompt(prompt) for prompt in examples]))
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+            rows, start = [], 0
+            for agent_type in agent_types:
+                count = len(ROUTING_EXAMPLES[agent_type])
+                rows.append(vectors[start:start + count].mean(axis=0))
+                start += count
+            centroids = np.array(rows)
+            centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+
+            cache_dir = os.path.dirname(CENTROID_CACHE_PATH)
+            os.makedirs(cache_dir, exist_ok=True)
+            # Write a temp file and rename it so a crash never leaves a truncated cache behind
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            try:
+                with open(fd, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "key": cache_key,
+                        "centroids": {agent_type.value: row.tolist() for agent_type, row in zip(agent_types, centroids)}
+                    }, f)
+                os.replace(tmp_path, CENTROID_CACHE_PATH)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+        self._centroids = (agent_types, centroids)
+        return self._centroids
+
+    def _classify_locally(self, user_prompt: str, query_vector: list) -> RouteClassification:
+        """Route by nearest centroid; returns None when the margin is too small to be trusted"""
+        agent_types, centroids = self._load_centroids()
+        query = np.asarray(query_vector)
+        similarities = centroids @ (query / np.linalg.norm(query))
+
+        ranked = np.argsort(similarities)[::-1]
+        best, runner_up = similarities[ranked[0]], similarities[ranked[1]]
+        margin = float(best - runner_up)
+        if margin <= LOCAL_ROUTING_MARGIN:
+            return None
+
+        agent_type = agent_types[ranked[0]]
+        return RouteClassification(
+            agent_type=agent_type,
+            confidence=min(1.0, 0.5 + margin),
+            reasoning=f"Closest to {agent_type.value} examples (similarity {best:.2f}, margin {margin:.2f})",
+            extracted_params=extract_params_locally(user_prompt)
+        )
+
+    def classify_request(self, user_prompt: str, query_vector: list = None) -> RouteClassification:
+        # Fastest path: confident keyword/regex match, checked before any cache lookup
+        classification = classify_by_keywords(user_prompt)
+        if classification is not None:
+            return classification
+
+        return self._classify(user_prompt, query_vector=query_vector)
+
+    @cached_classification
+    def _classify(self, user_prompt: str, query_vector: list = None) -> RouteClassification:
+        # Fast path: local nearest-centroid classification, no LLM round-trip
+        if query_vector is not None:
+            try:
+                classification = self._classify_locally(user_prompt, query_vector)
+                if classification is not None:
+                    return classification
+            except Exception:
+                pass  # Fall back to the LLM
 
-    def classify_request(self, user_prompt: str) -> RouteClassification:
         system_prompt = """
 You are an intelligent routing system that classifies user requests and directs them to specialized agents.
 
@@ -61,6 +332,10 @@ Examples:
                 extracted_params=ExtractedParams(category="fallback")
             )
     
+    async def classify_request_async(self, user_prompt: str, query_vector: list = None) -> RouteClassification:
+        """Classify without blocking the event loop so routing can overlap other lookups"""
+        return await asyncio.to_thread(self.classify_request, user_prompt, query_vector)
+
     def extract_specific_params(self, classification: RouteClassification, user_prompt: str) -> dict:
         if classification.extracted_params:
             # Convert Pydantic model to dict, excluding None values
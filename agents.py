@@ -1,28 +1,45 @@
 from abc import ABC, abstractmethod
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from clients import openai_client
 from models import AgentType
-from tools import DirectoryToolInput, FileToolInput, CollectOrderIdInput
 import tools
-import json
+import orjson
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+import time
 import streamlit as st
 
 load_dotenv()
 
+# st.write_stream re-renders the whole accumulated text per yielded chunk, so batch deltas
+STREAM_FLUSH_DELTAS = 16
+STREAM_FLUSH_INTERVAL = 0.05
+
+@lru_cache(maxsize=1)
+def _date_context(minute_bucket: int) -> str:
+    """Get today's date context; cached per minute so the text is identical across requests within it"""
+    today = datetime.now()
+    return f"Today is {today.strftime('%A, %B %d, %Y at %I:%M %p')}."
+
 # Base class for all specialized agents
 class BaseAgent(ABC):
     """Base class for all specialized agents"""
 
-    def __init__(self):
-        self.client = OpenAI()
-        self.model = "gpt-4o"
+    # System prompt specific to this agent; must stay constant (no per-request text) to be cacheable
+    SYSTEM_PROMPT = ""
 
-    @abstractmethod
-    def get_system_prompt(self) -> str:
-        """Get the system prompt specific to this agent"""
-        pass
+    # Model used by this agent; subclasses override when a smaller model is enough
+    model = "gpt-4o"
+
+    # Tool name -> callable; subclasses register their own tools with
+    # TOOLS = {**tools.TOOL_FUNCTIONS, "name": fn}
+    TOOLS = tools.TOOL_FUNCTIONS
+
+    def __init__(self):
+        self.client = openai_client
 
     @abstractmethod
     def get_available_tools(self) -> list:
@@ -31,48 +48,52 @@ class BaseAgent(ABC):
 
     def execute_tool(self, tool_name: str, args: dict) -> str:
         """Execute a tool call - can be overridden by specific agents"""
+        return tools.call_function(tool_name, args, self.TOOLS)
 
-        if tool_name == "directory_tool":
-            return tools.directory_tool(**args)
-        elif tool_name == "file_tool":
-            return tools.file_tool(**args)
-        elif tool_name == "get_order_detail":
-            return tools.get_order_detail(**args)
-        else:
-            return "Unknown tool"
+    def _safe_exec(self, call: dict) -> str:
+        """Parse a tool call's arguments and execute it, returning errors as the tool result"""
+        tool_name = call["function"]["name"]
+
+        try:
+            args = orjson.loads(call["function"]["arguments"])
+        except orjson.JSONDecodeError as e:
+            return f"Error parsing arguments for tool {tool_name}: {str(e)}"
+
+        try:
+            return self.execute_tool(tool_name, args)
+        except Exception as e:
+            return f"Error executing tool {tool_name}: {str(e)}"
 
     def process_request(self, user_prompt: str, extracted_params: dict = None) -> str:
         """Process the user request with this agent"""
 
-        system_prompt = self.get_system_prompt()
+        # Get today's date context
+        date_context = _date_context(int(time.time() // 60))
+        context_parts = [f"**Date Context:**\n{date_context}"]
 
         # Retrieve user memories
-        relevant_memories = extracted_params.get("memory_context", "")
-        if relevant_memories:
-            system_prompt += f"\n\n**User Memories:**\n{relevant_memories}"
+        if relevant_memories := extracted_params.get("memory_context"):
+            context_parts.append(f"**User Memories:**\n{relevant_memories}")
 
         # Perform RAG search to get relevant documents
-        rag_context = extracted_params.get("rag_context", "")
-        if rag_context:
-            system_prompt += f"\n\n**Company Documents:**\n{rag_context or '_No relevant documents found_'}"
-
-        # Get today's date context
-        today = datetime.now()
-        date_context = f"Today is {today.strftime('%A, %B %d, %Y at %I:%M:%S %p')}."
-        system_prompt += f"\n\n**Date Context:**\n{date_context}\n\n"
+        if rag_context := extracted_params.get("rag_context"):
+            context_parts.append(f"**Company Documents:**\n{rag_context}")
 
+        # The constant system prompt is its own leading message so it stays a
+        # byte-identical prefix for OpenAI's prompt cache; per-request context follows
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "system", "content": "\n\n".join(context_parts)},
             {"role": "user", "content": user_prompt}
         ]
 
-        full_response = ""
-        tool_calls = []
-        used_tools = []  # Track all tools used during the conversation
+        response_parts = []
+        # Tool call chunks keyed by their stream index; argument fragments are joined once complete
+        tool_calls = defaultdict(lambda: {"id": "", "name": "", "arguments": []})
+        used_tools = Counter()  # Track all tools used during the conversation
         
-        # Create status placeholders
+        # Create status placeholder
         status_placeholder = st.empty()
-        response_placeholder = st.empty()
 
         # Always use fallback for now to ensure it works
         status_placeholder.info(f"🤖 {self.__class__.__name__} is processing your request...")
@@ -84,73 +105,84 @@ class BaseAgent(ABC):
                 tools=self.get_available_tools(),
                 stream=True
             )
-            
-            for chunk in stream:
-                choice = chunk.choices[0]
-                delta = choice.delta
-                finish_reason = choice.finish_reason
-
-                if delta and delta.content:
-                    full_response += delta.content
-                    response_placeholder.markdown(full_response)
-                
-                elif delta and delta.tool_calls:
-                    for tool_chunk in delta.tool_calls:
-                        if len(tool_calls) <= tool_chunk.index:
-                            tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
-                        tc = tool_calls[tool_chunk.index]
-                        
-                        if tool_chunk.id:
-                            tc["id"] += tool_chunk.id
-                        
-                        if tool_chunk.function.name:
-                            tc["function"]["name"] += tool_chunk.function.name
-                        
-                        if tool_chunk.function.arguments:
-                            tc["function"]["arguments"] += tool_chunk.function.arguments
-                
-                # Handle tool calls if needed
-                if finish_reason == "tool_calls" and tool_calls:
+            finish_reason = None
+
+            def token_gen():
+                """Yield coalesced content for st.write_stream while accumulating tool call chunks"""
+                nonlocal finish_reason
+                pending = []
+                last_flush = time.monotonic()
+
+                for chunk in stream:
+                    choice = chunk.choices[0]
+                    delta = choice.delta
+                    finish_reason = choice.finish_reason
+
+                    if delta and delta.content:
+                        response_parts.append(delta.content)
+                        pending.append(delta.content)
+                        now = time.monotonic()
+                        if len(pending) >= STREAM_FLUSH_DELTAS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+                            yield "".join(pending)
+                            pending.clear()
+                            last_flush = now
+                    
+                    elif delta and delta.tool_calls:
+                        for tool_chunk in delta.tool_calls:
+                            tc = tool_calls[tool_chunk.index]
+                            
+                            if tool_chunk.id:
+                                tc["id"] += tool_chunk.id
+                            
+                            if tool_chunk.function.name:
+                                tc["name"] += tool_chunk.function.name
+                            
+                            if tool_chunk.function.arguments:
+                                tc["arguments"].append(tool_chunk.function.arguments)
+
+                if pending:
+                    yield "".join(pending)
+
+            # Each yielded chunk re-renders the full text, so token_gen yields every
+            # STREAM_FLUSH_DELTAS deltas or STREAM_FLUSH_INTERVAL seconds rather than per token
+            st.write_stream(token_gen())
+
+            # Handle tool calls if needed
+            if finish_reason == "tool_calls" and tool_calls:
+                calls = [
+                    {
+                        "id": tc["id"],
+                        "type": "function",
+                        "function": {
+                            "name": tc["name"],
+                            "arguments": "".join(tc["arguments"])
+                        }
+                    } for _, tc in sorted(tool_calls.items())
+                ]
+                messages.append({
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": calls
+                })
+
+                # Tools are I/O-bound, so run them concurrently; map keeps results in call order
+                with ThreadPoolExecutor(max_workers=min(8, len(calls))) as executor:
+                    results = list(executor.map(self._safe_exec, calls))
+
+                for call, result in zip(calls, results):
+                    tool_name = call["function"]["name"]
+                    
+                    # Track the tool usage
+                    used_tools[tool_name] += 1
+
                     messages.append({
-                        "role": "assistant",
-                        "content": None,
-                        "tool_calls": [
-                            {
-                                "id": call["id"],
-                                "type": "function",
-                                "function": {
-                                    "name": call["function"]["name"],
-                                    "arguments": call["function"]["arguments"]
-                                }
-                            } for call in tool_calls
-                        ]
+                        "role": "tool",
+                        "tool_name": tool_name,
+                        "tool_call_id": call["id"],
+                        "content": result
                     })
 
-                    for call in tool_calls:
-                        call_id = call["id"]
-                        tool_name = call["function"]["name"]
-                        
-                        # Track the tool usage
-                        used_tools.append(tool_name)
-
-                        try:
-                            args = json.loads(call["function"]["arguments"])
-                        except json.JSONDecodeError as e:
-                            continue
-                        
-                        try:
-                            result = self.execute_tool(tool_name, args)
-                        except Exception as e:
-                            result = f"Error executing tool {tool_name}: {str(e)}"
-
-                        messages.append({
-                            "role": "tool",
-                            "tool_name": tool_name,
-                            "tool_call_id": call_id,
-                            "content": result
-                        })
-
-                    tool_calls = []
+                tool_calls.clear()
 
             # Break if conversation is complete
             if finish_reason == "stop":
@@ -160,41 +192,34 @@ class BaseAgent(ABC):
         # Show tool usage if any tools were used
         if used_tools:
             with st.expander("🤖 Tool Usage", expanded=False):
-                for tool_name in used_tools:
-                    st.write(f"**{tool_name}**")
+                for tool_name, count in used_tools.items():
+                    st.write(f"**{tool_name}** ×{count}")
 
-        return full_response
+        return "".join(response_parts)
 
 # Customer Support Agent
 class CustomerAssistantAgent(BaseAgent):
     """Specialized agent for customer support and order inquiries"""
 
-    def get_system_prompt(self) -> str:
-        return (
-            "You are a helpful AI assistant. Answer the user's question based on the provided Company Documents and User Memories. "
-            "If the information is not available in either source, clearly state that you don't have that information.\n\n"
-            "Instructions:\n"
-            "- Use information from both User Memories and Company Documents\n"
-            "- User Memories contain personal context and conversation history\n"
-            "- Company Documents contain official business information\n"
-            "- If neither source contains the answer, say so clearly\n"
-            "- You can still use available tools if they help answer the user's question"
-        )
+    SYSTEM_PROMPT = (
+        "You are a helpful AI assistant. Answer the user's question based on the provided Company Documents and User Memories. "
+        "If the information is not available in either source, clearly state that you don't have that information.\n\n"
+        "Instructions:\n"
+        "- Use information from both User Memories and Company Documents\n"
+        "- User Memories contain personal context and conversation history\n"
+        "- Company Documents contain official business information\n"
+        "- If neither source contains the answer, say so clearly\n"
+        "- You can still use available tools if they help answer the user's question"
+    )
     
     def get_available_tools(self) -> list:
-        return [
-            {
-                "type": "function",
-                "function": tools.tool_schema(CollectOrderIdInput, "get_order_detail", "Read specific order ID for customer support")
-            }
-        ]
+        return [tools.TOOL_SCHEMAS["get_order_detail"], tools.TOOL_SCHEMAS["get_orders_batch"]]
 
 # Developer Assistant Agent
 class DeveloperAssistantAgent(BaseAgent):
     """Specialized agent for developer-related inquiries"""
 
-    def get_system_prompt(self) -> str:
-        return """You are an autonomous Log Analysis, Code Analysis and Fix Proposal Agent. Your expertise is in:
+    SYSTEM_PROMPT = """You are an autonomous Log Analysis, Code Analysis and Fix Proposal Agent. Your expertise is in:
 
 1. **Log File Analysis**: Reading and interpreting various log formats
 2. **Error Pattern Recognition**: Identifying common error patterns and anomalies
@@ -274,23 +299,15 @@ Always format your responses using proper markdown:
 Always be autonomous in your tool usage - decide which tools to use based on the user's request and your analysis findings."""
     
     def get_available_tools(self) -> list:
-        return [
-            {
-                "type": "function",
-                "function": tools.tool_schema(DirectoryToolInput, "directory_tool", "List all files and subdirectories in a given directory")
-            },
-            {
-                "type": "function",
-                "function": tools.tool_schema(FileToolInput, "file_tool", "Read content from a specific file, optionally with line range")
-            }
-        ]
+        return [tools.TOOL_SCHEMAS["directory_tool"], tools.TOOL_SCHEMAS["file_tool"]]
 
 # General Assistant Agent
 class GeneralAssistantAgent(BaseAgent):
     """General purpose assistant for unclear or general requests"""
+
+    model = "gpt-4o-mini"
     
-    def get_system_prompt(self) -> str:
-        return """You are a General Assistant Agent that helps users with various development and debugging tasks.
+    SYSTEM_PROMPT = """You are a General Assistant Agent that helps users with various development and debugging tasks.
 
 Your role is to:
 1. **Clarify Requirements**: Help users articulate their specific needs
@@ -1,37 +1,41 @@
+import asyncio
 from dotenv import load_dotenv
-from openai import OpenAI
 from mem0 import MemoryClient
 import streamlit as st
 from agent_router import router
 from agents import AgentFactory
-from supports import retrieve
+from supports import query_embedding, retrieve
 
 load_dotenv()
-client = OpenAI()
 memory_client = MemoryClient()
 
-def chat_with_ai(user_prompt: str, user_id="default_user") -> str:
+async def route_and_retrieve(user_prompt: str):
+    """Embed the prompt once and share the vector between routing and RAG retrieval"""
+    query_vector = await asyncio.to_thread(query_embedding, user_prompt)
+    return await asyncio.gather(
+        router.classify_request_async(user_prompt, query_vector),
+        asyncio.to_thread(retrieve, user_prompt, top_k=3, query_vector=query_vector)
+    )
+
+async def chat_with_ai(user_prompt: str, user_id="default_user") -> str:
 
-    # Step 1: Classify the request
+    # Steps 1, 3 and 4 are independent: classify the request, retrieve
+    # relevant memories and retrieve relevant documents concurrently
     with st.spinner("🔍 Analyzing your request..."):
-        classification = router.classify_request(user_prompt)
+        (classification, retrieve_results), relevant_memories = await asyncio.gather(
+            route_and_retrieve(user_prompt),
+            asyncio.to_thread(memory_client.search, query=user_prompt, user_id=user_id, limit=3)
+        )
 
     # Step 2: Extract specific parameters
     extracted_params = router.extract_specific_params(classification, user_prompt)
 
     # Step 3: add relevant memories for context
-    relevant_memories = []
-    with st.spinner("🧠 Retrieving relevant memories..."):
-        relevant_memories = memory_client.search(query=user_prompt, user_id=user_id, limit=3)
-
     if relevant_memories:
         memory_context = "\n".join(f"- {entry['memory']}" for entry in relevant_memories)
         extracted_params["memory_context"] = memory_context
 
-    # Step 4: Perform RAG search to get relevant documents
-    retrieve_results = []
-    with st.spinner("🔍 Retrieving relevant documents..."):
-        retrieve_results = retrieve(user_prompt, top_k=3)
+    # Step 4: add relevant documents for context
     if retrieve_results:
         extracted_params["rag_context"] = "\n".join(f"- {doc}" for doc in retrieve_results)
 
@@ -90,7 +94,7 @@ def main():
         
         # Generate AI response
         with st.chat_message("assistant"):
-            response = chat_with_ai(prompt)
+            response = asyncio.run(chat_with_ai(prompt))
             st.session_state.messages.append({"role": "assistant", "content": response})
     
     # Sidebar with instructions and memory management
@@ -0,0 +1,14 @@
+import httpx
+from dotenv import load_dotenv
+from openai import OpenAI
+
+load_dotenv()
+
+# Shared OpenAI client so every router/agent instance reuses one HTTP/2 connection pool
+openai_client = OpenAI(
+    http_client=httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+)
@@ -1,24 +1,81 @@
+import hashlib
+import os
 import re
+import tempfile
+from collections import OrderedDict
 from typing import List
 
 class MarkdownCleaner:
+    # Passes run in order; rules within a pass never interact, so they
+    # share a single scan of the content
+    CLEANING_PASSES = [
+        {
+            'image': (r'<!-- image -->', ''),       # Remove image placeholders
+        },
+        {
+            'comment': (r'<!--.*?-->', ''),         # Remove all HTML comments
+        },
+        {
+            'empty_header': (r'^#{2,3}\s*$', ''),   # Remove empty h2/h3 headers
+            'amp': (r'&amp;', '&'),                 # Fix HTML entities
+        },
+        {
+            'newlines': (r'\n{3,}', '\n\n'),        # Remove excessive newlines
+        },
+        {
+            'empty_item': (r'^\s*-\s*$', ''),       # Remove empty list items
+            'trailing': (r'[ \t]+$', ''),           # Remove trailing whitespace
+        },
+    ]
+
+    HEADER_PATTERN = re.compile(r'^#{1,6}.*$', re.MULTILINE)
+
+    # Cleaned output of files, named "<path hash>-<mtime/size/rules hash>" so that
+    # entries for older versions of a file can be found and pruned
+    CACHE_DIR = os.path.join('.cache', 'markdown')
+
+    # In-process cache of cleaned output keyed by a hash of the input, bounded by total output size
+    CONTENT_CACHE_MAX_CHARS = 4 * 1024 * 1024
+
     def __init__(self):
-        self.cleaning_rules = [
-            (r'<!-- image -->', ''),  # Remove image placeholders
-            (r'<!--.*?-->', ''),      # Remove all HTML comments
-            (r'^###\s*$', ''),        # Remove empty h3 headers
-            (r'^##\s*$', ''),         # Remove empty h2 headers
-            (r'&amp;', '&'),          # Fix HTML entities
-            (r'\n{3,}', '\n\n'),      # Remove excessive newlines
-            (r'^\s*-\s*$', ''),       # Remove empty list items
-            (r'[ \t]+$', ''),         # Remove trailing whitespace
-        ]
+        self.cleaning_rules = []
+        for rules in self.CLEANING_PASSES:
+            if len(rules) == 1:
+                (regex, replacement), = rules.values()
+                self.cleaning_rules.append((re.compile(regex, re.MULTILINE | re.DOTALL), replacement))
+                continue
+
+            # Fuse independent rules into one alternation and dispatch on the matched group
+            pattern = re.compile(
+                '|'.join(f'(?P<{name}>{regex})' for name, (regex, _) in rules.items()),
+                re.MULTILINE | re.DOTALL
+            )
+            replacements = {name: replacement for name, (_, replacement) in rules.items()}
+            self.cleaning_rules.append((pattern, lambda m, r=replacements: r[m.lastgroup]))
+
+        self._rules_signature = repr(self.CLEANING_PASSES)
+        self._content_cache = OrderedDict()
+        self._content_cache_chars = 0
     
     def clean_file(self, input_path: str, output_path: str = None) -> str:
-        with open(input_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        cleaned = self.clean_content(content)
+        stat = os.stat(input_path)
+        path_key = hashlib.sha256(os.path.abspath(input_path).encode('utf-8')).hexdigest()[:32]
+        version_key = hashlib.sha256(
+            f"{stat.st_mtime_ns}:{stat.st_size}:{self._rules_signature}".encode('utf-8')
+        ).hexdigest()[:32]
+        cache_name = f"{path_key}-{version_key}"
+        cache_path = os.path.join(self.CACHE_DIR, cache_name)
+
+        try:
+            with open(cache_path, 'r', encoding='utf-8', newline='') as f:
+                cleaned = f.read()
+        except FileNotFoundError:
+            # Not cached yet, or pruned by another process since: clean the source again
+            with open(input_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            
+            cleaned = self.clean_content(content)
+            self._write_cache(path_key, cache_name, cleaned)
         
         if output_path:
             with open(output_path, 'w', encoding='utf-8') as f:
@@ -26,10 +83,47 @@ class MarkdownCleaner:
         
         return cleaned
     
+    def _write_cache(self, path_key: str, cache_name: str, cleaned: str):
+        """Atomically store a cache entry and drop the entries of older versions of the same file"""
+        try:
+            os.makedirs(self.CACHE_DIR, exist_ok=True)
+            # Readers never see a partial file: write a temp file, then rename it into place
+            fd, tmp_path = tempfile.mkstemp(dir=self.CACHE_DIR, prefix=f"{path_key}-", suffix='.tmp')
+            try:
+                with open(fd, 'w', encoding='utf-8', newline='') as f:
+                    f.write(cleaned)
+                os.replace(tmp_path, os.path.join(self.CACHE_DIR, cache_name))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+            with os.scandir(self.CACHE_DIR) as it:
+                stale = [entry.path for entry in it if entry.name.startswith(f"{path_key}-") and entry.name != cache_name]
+            for path in stale:
+                os.unlink(path)
+        except OSError:
+            pass  # The cache is best-effort; the cleaned content is still returned
+    
     def clean_content(self, content: str) -> str:
+        key = hashlib.sha256(content.encode('utf-8')).digest()
+        cleaned = self._content_cache.get(key)
+        if cleaned is not None:
+            self._content_cache.move_to_end(key)
+            return cleaned
+
+        cleaned = self._clean_content(content)
+        if len(cleaned) <= self.CONTENT_CACHE_MAX_CHARS:
+            self._content_cache[key] = cleaned
+            self._content_cache_chars += len(cleaned)
+            while self._content_cache_chars > self.CONTENT_CACHE_MAX_CHARS:
+                _, evicted = self._content_cache.popitem(last=False)
+                self._content_cache_chars -= len(evicted)
+        return cleaned
+
+    def _clean_content(self, content: str) -> str:
         # Apply all cleaning rules
         for pattern, replacement in self.cleaning_rules:
-            content = re.sub(pattern, replacement, content, flags=re.MULTILINE | re.DOTALL)
+            content = pattern.sub(replacement, content)
         
         # Extract meaningful sections
         sections = self._extract_meaningful_sections(content)
@@ -39,28 +133,36 @@ class MarkdownCleaner:
     def _extract_meaningful_sections(self, content: str) -> List[str]:
         """Extract sections that contain substantial content"""
         sections = []
-        current_section = ""
+        current_lines = []  # Joined once per section instead of growing a string per line
         
-        for line in content.split('\n'):
-            if line.startswith('#') and current_section:
-                if self._has_content(current_section):
-                    sections.append(current_section.strip())
-                current_section = line + '\n'
+        for line in content.splitlines():
+            if line.startswith('#') and current_lines:
+                section = '\n'.join(current_lines)
+                if self._has_content(section):
+                    sections.append(section.strip())
+                current_lines = [line]
             else:
-                current_section += line + '\n'
+                current_lines.append(line)
         
         # Add final section
-        if current_section and self._has_content(current_section):
-            sections.append(current_section.strip())
+        if current_lines:
+            section = '\n'.join(current_lines)
+            if self._has_content(section):
+                sections.append(section.strip())
         
         return sections
     
     def _has_content(self, section: str) -> bool:
         """Check if section has meaningful content"""
         # Remove headers and get content
-        content = re.sub(r'^#{1,6}.*$', '', section, flags=re.MULTILINE)
+        content = self.HEADER_PATTERN.sub('', section)
         
-        # Count meaningful characters (letters, numbers)
-        meaningful = re.findall(r'\w', content)
+        # Count meaningful characters (letters, numbers), stopping once the threshold is reached
+        count = 0
+        for c in content:
+            if c.isalnum() or c == '_':
+                count += 1
+                if count > 15:  # Threshold for meaningful content
+                    return True
         
-        return len(meaningful) > 15  # Threshold for meaningful content
\ No newline at end of file
+        return False
\ No newline at end of file
@@ -1,29 +1,67 @@
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
+import threading
+from collections import OrderedDict
 from typing import List
 import textwrap
+import numpy as np
 from mem0 import MemoryClient
+from clients import openai_client
 
 from qdrant_client import QdrantClient
+from qdrant_client.http.models import (
+    Distance,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
 
 load_dotenv()
 
-openai_api_key = os.getenv("OPENAI_API_KEY")
-
-openai_client = OpenAI(api_key=openai_api_key)
 qdrant_client = QdrantClient(host="localhost", port=6333)
 memory_client = MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
 
 collection_name = "devopt_documents"
 chat_model = "gpt-4o"
 embedding_model="text-embedding-3-small"
+embedding_size = 1536
+query_embedding_cache_size = 1024
+
+# int8 scalar quantization kept in RAM; searches oversample and rescore with
+# the original vectors to hold recall
+quantization_config = ScalarQuantization(
+    scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+)
+hnsw_config = HnswConfigDiff(m=16, ef_construct=128)
+search_params = SearchParams(
+    hnsw_ef=64,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+def ensure_collection(name: str = collection_name, vector_size: int = embedding_size):
+    """Create a cosine collection with quantization and HNSW tuning if it doesn't exist yet"""
+    if qdrant_client.collection_exists(name):
+        return
+    qdrant_client.create_collection(
+        collection_name=name,
+        vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE),
+        quantization_config=quantization_config,
+        hnsw_config=hnsw_config
+    )
 
 def text_chunking(text, max_tokens=300) -> List[str]:
     # Approx 1 token = 4 characters in English
     chunk_size = max_tokens * 4
     return textwrap.wrap(text, chunk_size)
 
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, strip and collapse whitespace so trivial variations share a cache entry"""
+    return " ".join(prompt.lower().split())
+
 def text_embedding(text: str) -> List[float]:
     response = openai_client.embeddings.create(
         model=embedding_model,
@@ -31,18 +69,55 @@ def text_embedding(text: str) -> List[float]:
     )
     return response.data[0].embedding
 
+def text_embeddings_batch(texts: List[str], batch_size: int = 96) -> List[List[float]]:
+    """Embed many texts with one API call per batch, preserving input order"""
+    embeddings = []
+    for start in range(0, len(texts), batch_size):
+        response = openai_client.embeddings.create(
+            model=embedding_model,
+            input=texts[start:start + batch_size],
+        )
+        embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+    return embeddings
+
+# Normalized prompt -> float32 vector (~6 KB each instead of ~50 KB as a tuple of Python floats)
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+
+def query_embedding(query: str) -> List[float]:
+    """Embed a user query once and reuse it for routing, caching and RAG.
+
+    The normalized prompt is only the cache key; the text as typed is what gets embedded.
+    """
+    key = normalize_prompt(query)
+    with _query_embeddings_lock:
+        vector = _query_embeddings.get(key)
+        if vector is not None:
+            _query_embeddings.move_to_end(key)
+
+    if vector is None:
+        vector = np.asarray(text_embedding(query), dtype=np.float32)
+        with _query_embeddings_lock:
+            _query_embeddings[key] = vector
+            if len(_query_embeddings) > query_embedding_cache_size:
+                _query_embeddings.popitem(last=False)
+
+    return vector.tolist()
+
 def vector_search(query_vector: List[float], top_k: int = 5) -> List[str]:
 
     search_result = qdrant_client.query_points(
         collection_name=collection_name,
         query=query_vector,
         limit=top_k,
+        search_params=search_params,
         with_payload=True
     ).points
 
     matched_texts = [hit.payload["text"] for hit in search_result]
     return matched_texts
 
-def retrieve(query: str, top_k: int = 5) -> List[str]:
-    query_vector = text_embedding(query)
+def retrieve(query: str, top_k: int = 5, query_vector: List[float] = None) -> List[str]:
+    if query_vector is None:
+        query_vector = query_embedding(query)
     return vector_search(query_vector, top_k)
\ No newline at end of file
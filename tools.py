@@ -1,12 +1,67 @@
-from pathlib import Path
 from pydantic import BaseModel, Field
-import json
+import atexit
+import codecs
 import os
-import requests
+import stat
+import threading
+import time
+from cachetools import TTLCache
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from types import MappingProxyType
+import httpx
+import orjson
 
 API_URL = os.getenv("API_URL")
 API_KEY = os.getenv("API_KEY")
 
+# Shared HTTP/2 client so concurrent order lookups are multiplexed over pooled connections
+_CLIENT = httpx.Client(
+    base_url=API_URL or "",
+    headers={
+        "apikey": API_KEY or "",
+        "Content-Type": "application/json"
+    },
+    timeout=httpx.Timeout(10.0, connect=3.0),
+    transport=httpx.HTTPTransport(
+        http2=True,
+        retries=3,
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+    )
+)
+atexit.register(_CLIENT.close)
+
+# Directories larger than this stat their entries on a thread pool; stat() releases the GIL,
+# which hides per-entry latency on network/FUSE filesystems
+_PARALLEL_STAT_THRESHOLD = 256
+_STAT_WORKERS = 16
+
+# file_tool read buffers: larger than the 8 KiB default to cut read() syscalls, bigger still for large files
+_READ_BUFFER_SIZE = 1 << 17
+_LARGE_FILE_READ_BUFFER_SIZE = 1 << 20
+_LARGE_FILE_THRESHOLD = 8 << 20
+# Range reads only count the lines after the window for files up to this size
+_COUNT_LINES_MAX_SIZE = 1 << 20
+# Head of the file checked for NUL bytes / invalid UTF-8 before reading the rest
+_BINARY_SNIFF_SIZE = 8192
+_Utf8Decoder = codecs.getincrementaldecoder("utf-8")
+
+# Largest order payload buffered for the model; larger bodies are rejected without being read in full
+ORDER_RESPONSE_MAX_BYTES = 1024 * 1024
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Agents often re-ask for the same order on consecutive turns; keep recent rows briefly.
+# Keyed by (order_id, API_URL) and locked because tools run on a thread pool. Cached row
+# lists are shared between callers, so treat tool results as read-only.
+_ORDER_CACHE = TTLCache(maxsize=1024, ttl=30)
+_ORDER_CACHE_LOCK = threading.Lock()
+
+# Concurrent get_order_detail calls arriving within this window share one in.(...) request
+ORDER_BATCH_WINDOW = 0.005
+# IDs per in.(...) query; larger batches are split to keep the query string bounded
+ORDER_BATCH_MAX_IDS = 100
+
 # Enhanced tool models
 class DirectoryToolInput(BaseModel):
     directory: str = Field(..., description="Path to directory to list files and subdirectories")
@@ -19,107 +74,371 @@ class FileToolInput(BaseModel):
 class CollectOrderIdInput(BaseModel):
     order_id: str = Field(..., description="Order ID for customer support")
 
+class CollectOrderIdsInput(BaseModel):
+    order_ids: list[int] = Field(..., description="Order IDs to look up together for customer support")
+
+@lru_cache(maxsize=None)
+def _model_schema(model: type[BaseModel]) -> dict:
+    # Tool input models are static, so generate each JSON schema only once
+    return model.model_json_schema()
+
 def tool_schema(model: BaseModel, name: str, description: str):
     return {
         "name": name,
         "description": description,
-        "parameters": model.model_json_schema()
+        "parameters": _model_schema(model)
     }
 
-def directory_tool(directory: str) -> str:
+# Function-calling manifest built once at import; agents hand these entries to the API as-is
+TOOL_SCHEMAS = {
+    name: {"type": "function", "function": tool_schema(model, name, description)}
+    for model, name, description in (
+        (DirectoryToolInput, "directory_tool", "List all files and subdirectories in a given directory"),
+        (FileToolInput, "file_tool", "Read content from a specific file, optionally with line range"),
+        (CollectOrderIdInput, "get_order_detail", "Read specific order ID for customer support"),
+        (CollectOrderIdsInput, "get_orders_batch", "Read several order IDs at once for customer support"),
+    )
+}
+
+# Size units indexed by (bit_length - 1) // 10, i.e. by which power of 1024 the size reaches
+_UNITS = [("B", 1), ("KB", 1024), ("MB", 1024 * 1024), ("GB", 1024 * 1024 * 1024)]
+
+def _format_size(size: int) -> str:
+    idx = min(max(size.bit_length() - 1, 0) // 10, len(_UNITS) - 1)
+    unit, div = _UNITS[idx]
+    return f"{size}{unit}" if div == 1 else f"{size/div:.1f}{unit}"
+
+def _entry_info(entry: os.DirEntry) -> dict:
+    # DirEntry caches the file type from readdir, so is_dir() needs no extra syscall
+    if entry.is_dir():
+        return {"name": entry.name, "is_dir": True, "size": None}
+    return {"name": entry.name, "is_dir": False, "size": entry.stat().st_size}
+
+def directory_tool(directory: str) -> dict:
     """List all files and subdirectories in the given directory"""
-    dir_path = Path(directory)
-    if not dir_path.exists():
-        return f"[ERROR] Directory {directory} not found"
-    
-    if not dir_path.is_dir():
-        return f"[ERROR] {directory} is not a directory"
+    try:
+        # scandir reports a missing path or a file in the same call that opens the directory
+        with os.scandir(directory) as it:
+            entries = list(it)
+    except FileNotFoundError:
+        return {"error": f"[ERROR] Directory {directory} not found"}
+    except NotADirectoryError:
+        return {"error": f"[ERROR] {directory} is not a directory"}
+    except Exception as e:
+        return {"error": f"[ERROR] Could not read directory {directory}: {e}"}
     
     try:
-        items = []
-        # List directories first
-        for item in sorted(dir_path.iterdir()):
-            if item.is_dir():
-                items.append(f"📁 {item.name}/")
-            else:
-                # Show file with size
-                size = item.stat().st_size
-                if size < 1024:
-                    size_str = f"{size}B"
-                elif size < 1024 * 1024:
-                    size_str = f"{size/1024:.1f}KB"
-                else:
-                    size_str = f"{size/(1024*1024):.1f}MB"
-                items.append(f"📄 {item.name} ({size_str})")
-        
-        if not items:
-            return f"Directory {directory} is empty"
+        entries.sort(key=lambda entry: entry.name)
+        if len(entries) > _PARALLEL_STAT_THRESHOLD:
+            # map() returns results in input order, so the listing stays sorted
+            with ThreadPoolExecutor(max_workers=_STAT_WORKERS) as executor:
+                items = list(executor.map(_entry_info, entries))
+        else:
+            items = [_entry_info(entry) for entry in entries]
         
-        return f"Contents of {directory}:\n" + "\n".join(items)
+        return {"directory": directory, "entries": items}
     
     except Exception as e:
-        return f"[ERROR] Could not read directory {directory}: {e}"
+        return {"error": f"[ERROR] Could not read directory {directory}: {e}"}
+
+def _read_all(fd: int, size: int) -> bytes:
+    """Read a whole file with unbuffered os.read calls, normally a single one"""
+    chunks = []
+    while chunk := os.read(fd, max(size, _READ_BUFFER_SIZE)):
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _read_line_window(fd: int, start_line: int, end_line: int, block_size: int, count_rest: bool) -> tuple[bytes, int | None]:
+    """Return the raw bytes of lines start_line..end_line and the total line count.
+
+    Newlines are located with bytes.count/bytes.index on raw blocks, so skipped lines are never
+    decoded or turned into Python objects. total is None when the file continues past the
+    window and count_rest is False.
+    """
+    window = []
+    lines = 0  # newlines seen before the current position
+    collecting = start_line == 1
+    last_block = b""
+    while block := os.read(fd, block_size):
+        last_block = block
+        pos = 0
+        if not collecting:
+            skip = start_line - 1 - lines
+            newlines = block.count(b"\n")
+            if newlines < skip:
+                lines += newlines
+                continue
+            for _ in range(skip):
+                pos = block.index(b"\n", pos) + 1
+            lines += skip
+            collecting = True
+        take = max(end_line - lines, 0)
+        newlines = block.count(b"\n", pos)
+        if newlines < take:
+            window.append(block[pos:])
+            lines += newlines
+            continue
+        end = pos
+        for _ in range(take):
+            end = block.index(b"\n", end) + 1
+        window.append(block[pos:end])
+        lines += take
+        rest = block[end:] or os.read(fd, block_size)
+        if not rest:
+            return b"".join(window), lines
+        if not count_rest:
+            return b"".join(window), None
+        last_block = rest
+        lines += rest.count(b"\n")
+        while block := os.read(fd, block_size):
+            last_block = block
+            lines += block.count(b"\n")
+        break
+    # A final line without a trailing newline still counts as a line
+    return b"".join(window), lines + (last_block[-1:] not in (b"", b"\n"))
+
+def _split_lines(text: str) -> list[str]:
+    """Split on "\n" only, dropping the "\r" of CRLF endings.
+
+    This is the rule _read_line_window counts by, so whole-file and range reads number lines
+    the same way; str.splitlines() would also break on "\r", "\f", "\x85", "\u2028", ...
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    if lines[-1] == "":
+        lines.pop()
+    return lines
 
-def file_tool(filepath: str, start_line: int = 1, end_line: int = -1) -> str:
+def file_tool(filepath: str, start_line: int = 1, end_line: int = -1) -> dict:
     """Read content from a file, optionally with line range"""
-    file_path = Path(filepath)
-    if not file_path.exists():
-        return f"[ERROR] File {filepath} not found"
-    
-    if file_path.is_dir():
-        return f"[ERROR] {filepath} is a directory, not a file. Use directory_tool instead."
-    
     try:
-        content = file_path.read_text(encoding='utf-8')
-        lines = content.splitlines()
-        
-        # Handle line range
-        if end_line == -1:
-            end_line = len(lines)
-        
         start_line = max(1, start_line)
-        end_line = min(len(lines), end_line)
-        
-        if start_line > len(lines):
-            return f"[ERROR] Start line {start_line} is beyond file length ({len(lines)} lines)"
         
-        selected_lines = lines[start_line - 1:end_line]
-        
-        # Add line numbers for easier reference
-        numbered_lines = []
-        for i, line in enumerate(selected_lines, start=start_line):
-            numbered_lines.append(f"{i:4d}: {line}")
+        # Handle line range
+        fd = os.open(filepath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            st = os.fstat(fd)
+            if stat.S_ISDIR(st.st_mode):
+                return {"error": f"[ERROR] {filepath} is a directory, not a file. Use directory_tool instead."}
+            size = st.st_size
+
+            # Fail fast on binary files before reading the rest; the incremental decoder
+            # tolerates a multi-byte character cut at the end of the sniffed head
+            head = os.read(fd, _BINARY_SNIFF_SIZE)
+            if b"\x00" in head:
+                return {"error": f"[ERROR] Could not decode file {filepath} - it may be a binary file"}
+            _Utf8Decoder().decode(head)
+
+            if end_line == -1:
+                # Whole file: bypass buffered I/O and decode the bytes directly
+                data = head + _read_all(fd, size)
+                lines = _split_lines(data.decode('utf-8'))
+                total_lines = end_line = len(lines)
+                selected_lines = lines[start_line - 1:]
+            else:
+                # Stop reading after the requested window; only small files are read to the end
+                # for an exact line count, otherwise total_lines stays unknown (None)
+                os.lseek(fd, 0, os.SEEK_SET)
+                block_size = _LARGE_FILE_READ_BUFFER_SIZE if size > _LARGE_FILE_THRESHOLD else _READ_BUFFER_SIZE
+                window, total_lines = _read_line_window(
+                    fd, start_line, end_line, block_size, size <= _COUNT_LINES_MAX_SIZE
+                )
+                # Only the requested window is decoded
+                selected_lines = _split_lines(window.decode('utf-8'))
+                if total_lines is not None:
+                    end_line = min(total_lines, end_line)
+        finally:
+            os.close(fd)
         
-        result = f"File: {filepath}\n"
-        if start_line == 1 and end_line == len(lines):
-            result += f"Full content ({len(lines)} lines):\n"
-        else:
-            result += f"Lines {start_line}-{end_line} of {len(lines)} total lines:\n"
+        if total_lines is not None and start_line > total_lines:
+            return {"error": f"[ERROR] Start line {start_line} is beyond file length ({total_lines} lines)"}
         
-        result += "\n".join(numbered_lines)
-        return result
+        # total is None when the file continues past the window and was not counted
+        return {"filepath": filepath, "start": start_line, "end": end_line, "total": total_lines, "lines": selected_lines}
     
+    except (FileNotFoundError, NotADirectoryError):
+        return {"error": f"[ERROR] File {filepath} not found"}
+    except (IsADirectoryError, PermissionError) as e:
+        # Windows refuses to open directories with PermissionError rather than IsADirectoryError
+        if os.path.isdir(filepath):
+            return {"error": f"[ERROR] {filepath} is a directory, not a file. Use directory_tool instead."}
+        return {"error": f"[ERROR] Could not read file {filepath}: {e}"}
     except UnicodeDecodeError:
-        return f"[ERROR] Could not decode file {filepath} - it may be a binary file"
+        return {"error": f"[ERROR] Could not decode file {filepath} - it may be a binary file"}
     except Exception as e:
-        return f"[ERROR] Could not read file {filepath}: {e}"
+        return {"error": f"[ERROR] Could not read file {filepath}: {e}"}
+
+def _read_bounded(response: httpx.Response, max_bytes: int = ORDER_RESPONSE_MAX_BYTES) -> str:
+    """Read a streamed response body, keeping memory bounded by max_bytes"""
+    # Content-Length counts the encoded (possibly compressed) body, so it can only reject early;
+    # the limit itself is enforced on the decoded bytes below
+    content_length = response.headers.get("Content-Length")
+    if content_length is not None and int(content_length) > max_bytes:
+        raise ValueError(f"Response of {content_length} bytes exceeds the {max_bytes} byte limit")
+
+    body = bytearray()
+    for chunk in response.iter_bytes(chunk_size=_STREAM_CHUNK_SIZE):
+        body += chunk
+        if len(body) > max_bytes:
+            raise ValueError(f"Response exceeds the {max_bytes} byte limit")
+    return body.decode(response.charset_encoding or "utf-8")
+
+def _normalize_order_id(order_id) -> int:
+    """Validate an order ID from the LLM; only plain digits may reach a PostgREST filter"""
+    text = str(order_id).strip()
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError(f"Invalid order ID {order_id!r}")
+    return int(text)
+
+def _fetch_order(order_id: int) -> list:
+    with _CLIENT.stream("GET", "/orders", params={"order_id": f"eq.{order_id}"}) as response:
+        response.raise_for_status()
+        return orjson.loads(_read_bounded(response))
+
+def get_orders_batch(order_ids: list[int]) -> list | dict:
+    """Look up several orders in one round trip with a PostgREST in.(...) filter"""
+    try:
+        order_ids = [_normalize_order_id(order_id) for order_id in order_ids]
+    except ValueError as e:
+        return {"error": f"[ERROR] {e}"}
+
+    rows = []
+    for start in range(0, len(order_ids), ORDER_BATCH_MAX_IDS):
+        chunk = order_ids[start:start + ORDER_BATCH_MAX_IDS]
+        with _CLIENT.stream("GET", "/orders", params={"order_id": f"in.({','.join(map(str, chunk))})"}) as response:
+            response.raise_for_status()
+            rows.extend(orjson.loads(_read_bounded(response)))
+    return rows
+
+class _OrderBatcher:
+    """Coalesce concurrent order lookups into one get_orders_batch request (DataLoader style).
+
+    The first caller of a window waits for the others to join, fetches every pending ID at once
+    and scatters the rows back to each caller by order_id. IDs must already be normalized ints,
+    so the scatter keys match what the single-ID eq. lookup would have returned.
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        self._lock = threading.Lock()
+        self._pending = None  # order_id -> Future for the open window
+
+    def load(self, order_id) -> list:
+        with self._lock:
+            leader = self._pending is None
+            if leader:
+                self._pending = {}
+            future = self._pending.get(order_id)
+            if future is None:
+                future = self._pending[order_id] = Future()
+
+        if leader:
+            time.sleep(self._window)
+            with self._lock:
+                batch, self._pending = self._pending, None
+            self._dispatch(batch)
+        return future.result()
+
+    def _dispatch(self, batch: dict):
+        try:
+            if len(batch) == 1:
+                # Nothing to coalesce: keep the plain eq. lookup
+                (order_id, future), = batch.items()
+                future.set_result(_fetch_order(order_id))
+                return
 
-def get_order_detail(order_id: int):
+            rows_by_id = defaultdict(list)
+            for row in get_orders_batch(list(batch)):
+                try:
+                    rows_by_id[_normalize_order_id(row.get("order_id"))].append(row)
+                except ValueError:
+                    continue  # A malformed row can't be matched to a caller; don't fail the whole window
+            for order_id, future in batch.items():
+                future.set_result(rows_by_id.get(order_id, []))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+_ORDER_BATCHER = _OrderBatcher(ORDER_BATCH_WINDOW)
+
+def get_order_detail(order_id: int) -> list | dict:
     """This is a publically available API that returns the weather for a given location."""
-    response = requests.get(
-        f"{API_URL}/orders?order_id=eq.{order_id}",
-        headers={
-            "apikey": API_KEY,
-            "Content-Type": "application/json"
-        }
-    )
+    try:
+        order_id = _normalize_order_id(order_id)
+    except ValueError as e:
+        return {"error": f"[ERROR] {e}"}
+
+    key = (order_id, API_URL)
+    with _ORDER_CACHE_LOCK:
+        cached = _ORDER_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    detail = _ORDER_BATCHER.load(order_id)
+
+    with _ORDER_CACHE_LOCK:
+        _ORDER_CACHE[key] = detail
+    return detail
+
+def _invalidate_order(order_id: int):
+    """Drop a cached order, e.g. after it has been updated"""
+    with _ORDER_CACHE_LOCK:
+        _ORDER_CACHE.pop((_normalize_order_id(order_id), API_URL), None)
 
-    return json.dumps(response.json())
+get_order_detail.invalidate = _invalidate_order
 
-def call_function(name, args):
-    if name == "directory_tool":
-        return directory_tool(**args)
-    elif name == "file_tool":
-        return file_tool(**args)
-    elif name == "get_order_detail":
-        return get_order_detail(**args)
\ No newline at end of file
+# Tool name -> callable; read-only so extending it for one agent can't change the global registry
+TOOL_FUNCTIONS = MappingProxyType({
+    "directory_tool": directory_tool,
+    "file_tool": file_tool,
+    "get_order_detail": get_order_detail,
+    "get_orders_batch": get_orders_batch,
+})
+
+def format_directory(result: dict) -> str:
+    directory, entries = result["directory"], result["entries"]
+    if not entries:
+        return f"Directory {directory} is empty"
+    items = [
+        f"📁 {entry['name']}/" if entry["is_dir"] else f"📄 {entry['name']} ({_format_size(entry['size'])})"
+        for entry in entries
+    ]
+    return f"Contents of {directory}:\n" + "\n".join(items)
+
+def format_file(result: dict) -> str:
+    start, end, total = result["start"], result["end"], result["total"]
+    text = f"File: {result['filepath']}\n"
+    if start == 1 and end == total:
+        text += f"Full content ({total} lines):\n"
+    elif total is None:
+        text += f"Lines {start}-{end} of more than {end} total lines:\n"
+    else:
+        text += f"Lines {start}-{end} of {total} total lines:\n"
+    
+    # Add line numbers for easier reference
+    text += "\n".join(f"{i:4d}: {line}" for i, line in enumerate(result["lines"], start=start))
+    return text
+
+def format_orders(rows: list) -> str:
+    return orjson.dumps(rows).decode()
+
+_FORMATTERS = {
+    "directory_tool": format_directory,
+    "file_tool": format_file,
+    "get_order_detail": format_orders,
+    "get_orders_batch": format_orders,
+}
+
+def format_tool_result(name: str, result) -> str:
+    """Render a structured tool result as the text handed to the LLM"""
+    if isinstance(result, dict) and "error" in result:
+        return result["error"]
+    formatter = _FORMATTERS.get(name)
+    return formatter(result) if formatter else str(result)
+
+def call_function(name, args, registry=TOOL_FUNCTIONS):
+    try:
+        fn = registry[name]
+    except KeyError:
+        return f"[ERROR] Unknown tool {name}"
+    return format_tool_result(name, fn(**args))
\ No newline at end of file